@@ -1,11 +1,14 @@
 import argparse
 import csv
+import io
+import sys
 from dataclasses import dataclass
+from operator import itemgetter
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, List, Optional, TextIO, Tuple
 
 
-@dataclass
+@dataclass(slots=True)
 class Horse:
     key: str
     sire: Optional[str]
@@ -19,16 +22,19 @@ class Horse:
     is_placeholder: bool = False
 
 
-@dataclass
+@dataclass(slots=True)
 class PedigreeNode:
     horse: Horse
     sire: Optional["PedigreeNode"] = None
     dam: Optional["PedigreeNode"] = None
-    row_start: int = 0
-    row_end: int = 0
     depth: int = 0
 
 
+HORSE_COLUMNS = ("PrimaryKey", "Sire", "Dam", "Sex", "Color", "Year", "Details", "URL", "Horse Name")
+# The other columns are optional and read as "" when absent.
+REQUIRED_COLUMNS = ("PrimaryKey", "Sire", "Dam")
+
+
 UNKNOWN_HORSE = Horse(
     key="UNKNOWN",
     sire=None,
@@ -42,143 +48,188 @@ UNKNOWN_HORSE = Horse(
 )
 
 
-def placeholder_horse() -> Horse:
-    return Horse(
-        key="",
-        sire=None,
-        dam=None,
-        sex="",
-        color="",
-        year="",
-        details="",
-        url="",
-        name="",
-        is_placeholder=True,
-    )
+# Fills every empty slot of a pedigree; shared because it is never modified.
+PLACEHOLDER_HORSE = Horse(
+    key="",
+    sire=None,
+    dam=None,
+    sex="",
+    color="",
+    year="",
+    details="",
+    url="",
+    name="",
+    is_placeholder=True,
+)
 
 
 def load_horses(csv_path: Path) -> Dict[str, Horse]:
     horses: Dict[str, Horse] = {}
-    with csv_path.open(newline="", encoding="utf-8") as handle:
-        reader = csv.DictReader(handle)
+    with csv_path.open(newline="", encoding="utf-8-sig") as handle:
+        reader = csv.reader(handle)
+        header = next(reader, [])
+        missing = [name for name in REQUIRED_COLUMNS if name not in header]
+        if missing:
+            raise SystemExit(f"CSV is missing columns: {', '.join(missing)}")
+        # Like csv.DictReader, a duplicated header name resolves to its last column.
+        positions = {name: index for index, name in enumerate(header)}
+        # An absent optional column picks index -1, a blank appended to each row.
+        pad = any(name not in positions for name in HORSE_COLUMNS)
+        pick = itemgetter(*(positions.get(name, -1) for name in HORSE_COLUMNS))
+        width = len(header)
         for row in reader:
-            key = (row.get("PrimaryKey") or "").strip()
+            if len(row) < width:
+                row.extend([""] * (width - len(row)))
+            if pad:
+                row.append("")
+            key, sire, dam, sex, color, year, details, url, name = map(str.strip, pick(row))
             if not key:
                 continue
+            # Keys, parents, sex, colour and year repeat across thousands of
+            # rows; interning them shares one string object per value, and a
+            # parent key then hits the horses dict by identity.
+            key = sys.intern(key)
             horses[key] = Horse(
                 key=key,
-                sire=(row.get("Sire") or "").strip() or None,
-                dam=(row.get("Dam") or "").strip() or None,
-                sex=(row.get("Sex") or "").strip(),
-                color=(row.get("Color") or "").strip(),
-                year=(row.get("Year") or "").strip(),
-                details=(row.get("Details") or "").strip(),
-                url=(row.get("URL") or "").strip(),
-                name=(row.get("Horse Name") or "").strip() or key,
+                sire=sys.intern(sire) if sire else None,
+                dam=sys.intern(dam) if dam else None,
+                sex=sys.intern(sex),
+                color=sys.intern(color),
+                year=sys.intern(year),
+                details=details,
+                url=url,
+                name=name or key,
             )
     return horses
 
 
-def build_tree(horses: Dict[str, Horse], key: str, generations: int) -> PedigreeNode:
-    root_horse = horses.get(key, UNKNOWN_HORSE)
+def build_tree(horses: Dict[str, Horse], key: str, generations: int) -> List[PedigreeNode]:
+    """Build the pedigree as an Ahnentafel array.
+
+    The sire and dam of ``nodes[i]`` sit at ``nodes[2 * i + 1]`` and
+    ``nodes[2 * i + 2]``, so the root is ``nodes[0]`` and the last
+    generation fills the second half of the list.
+
+    An ancestor that appears several times at the same depth (inbreeding)
+    shares one node, so its parents are looked up only once. Row spans
+    depend on the position rather than the node; see ``assign_rows``.
+    """
+    nodes: List[PedigreeNode] = [None] * ((1 << generations) - 1)
+    nodes[0] = PedigreeNode(horse=horses.get(key, UNKNOWN_HORSE))
+    shared: Dict[Tuple[str, int], PedigreeNode] = {}
 
-    def build_node(horse: Horse, depth: int) -> PedigreeNode:
-        node = PedigreeNode(horse=horse, depth=depth)
-        if depth < generations - 1:
-            sire_key = horse.sire
-            dam_key = horse.dam
+    def shared_node(horse: Horse, depth: int) -> PedigreeNode:
+        node = shared.get((horse.key, depth))
+        if node is None:
+            node = shared[(horse.key, depth)] = PedigreeNode(horse=horse, depth=depth)
+        return node
+
+    first_leaf = (1 << (generations - 1)) - 1
+    for index in range(first_leaf):
+        node = nodes[index]
+        if node.sire is None:
+            sire_key = node.horse.sire
+            dam_key = node.horse.dam
             sire_horse = horses.get(sire_key) if sire_key else None
             dam_horse = horses.get(dam_key) if dam_key else None
             if sire_horse is None:
-                sire_horse = placeholder_horse()
+                sire_horse = PLACEHOLDER_HORSE
             if dam_horse is None:
-                dam_horse = placeholder_horse()
-            node.sire = build_node(sire_horse, depth + 1)
-            node.dam = build_node(dam_horse, depth + 1)
-        return node
+                dam_horse = PLACEHOLDER_HORSE
+            node.sire = shared_node(sire_horse, node.depth + 1)
+            node.dam = shared_node(dam_horse, node.depth + 1)
+        nodes[2 * index + 1] = node.sire
+        nodes[2 * index + 2] = node.dam
+    return nodes
 
-    return build_node(root_horse, 0)
 
+def assign_rows(nodes: List[PedigreeNode]) -> List[Tuple[int, int]]:
+    """Return the (row_start, row_end) span of each slot of the node array."""
+    spans: List[Tuple[int, int]] = [(0, 0)] * len(nodes)
+    first_leaf = len(nodes) // 2
+    for index in range(len(nodes) - 1, -1, -1):
+        if index >= first_leaf:
+            spans[index] = (index - first_leaf, index - first_leaf)
+        else:
+            spans[index] = (spans[2 * index + 1][0], spans[2 * index + 2][1])
+    return spans
 
-def assign_rows(node: PedigreeNode, leaf_index: int, generations: int) -> int:
-    if node.depth >= generations - 1 or (node.sire is None and node.dam is None):
-        node.row_start = leaf_index
-        node.row_end = leaf_index
-        return leaf_index + 1
 
-    if node.sire is not None:
-        leaf_index = assign_rows(node.sire, leaf_index, generations)
-    if node.dam is not None:
-        leaf_index = assign_rows(node.dam, leaf_index, generations)
+def collect_cells(nodes: List[PedigreeNode], spans: List[Tuple[int, int]]) -> Dict[tuple, int]:
+    return {(spans[index][0], node.depth): index for index, node in enumerate(nodes)}
 
-    node.row_start = node.sire.row_start if node.sire else node.dam.row_start
-    node.row_end = node.dam.row_end if node.dam else node.sire.row_end
-    return leaf_index
 
-
-def collect_cells(node: PedigreeNode, cells: Dict[tuple, PedigreeNode]) -> None:
-    cells[(node.row_start, node.depth)] = node
-    if node.sire:
-        collect_cells(node.sire, cells)
-    if node.dam:
-        collect_cells(node.dam, cells)
+# Escapes text for element content and double-quoted attributes in a single pass.
+HTML_ESCAPE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", "\"": "&quot;"})
 
 
 def horse_label(horse: Horse) -> str:
     if horse.is_placeholder:
         return "&nbsp;"
-    name = horse.name or horse.key
+    name = (horse.name or horse.key).translate(HTML_ESCAPE)
     extras = " ".join(part for part in [horse.year, horse.color] if part)
     if horse.details:
         extras = " ".join(part for part in [extras, horse.details] if part)
     if extras:
-        return f"{name}<br><span class=\"meta\">{extras}</span>"
+        return f"{name}<br><span class=\"meta\">{extras.translate(HTML_ESCAPE)}</span>"
     return name
 
 
+SEX_CLASSES = {"M": "b_ml", "F": "b_fml"}
+
+
 def horse_class(horse: Horse) -> str:
     if horse.is_placeholder:
         return "b_empty"
-    if horse.sex == "M":
-        return "b_ml"
-    if horse.sex == "F":
-        return "b_fml"
-    return "b_unknown"
+    return SEX_CLASSES.get(horse.sex, "b_unknown")
+
 
+EMPTY_CELL = "<td class=\"b_empty\">&nbsp;</td>"
+CELL_TEMPLATE = "<td class=\"{cls}\" rowspan=\"{rowspan}\">{label}</td>"
 
-def render_pedigree(root: PedigreeNode, generations: int) -> str:
+
+def render_pedigree(
+    nodes: List[PedigreeNode], spans: List[Tuple[int, int]], generations: int, out: TextIO
+) -> None:
+    """Write the table rows to ``out``, rows separated by newlines."""
     leaf_rows = 2 ** (generations - 1)
-    cells: Dict[tuple, PedigreeNode] = {}
-    collect_cells(root, cells)
+    cells = collect_cells(nodes, spans)
     coverage = [0] * generations
-    rows_html = []
+    # A horse repeated at the same depth renders to the same cell, and its
+    # label is shared across depths.
+    cell_html: Dict[Tuple[str, int], str] = {}
+    labels: Dict[str, str] = {}
 
+    write = out.write
     for row in range(leaf_rows):
-        row_cells = []
+        write("\n<tr>" if row else "<tr>")
         for col in range(generations):
             if coverage[col] > 0:
                 coverage[col] -= 1
                 continue
-            node = cells.get((row, col))
-            if node is None:
-                row_cells.append("<td class=\"b_empty\">&nbsp;</td>")
+            index = cells.get((row, col))
+            if index is None:
+                write(EMPTY_CELL)
                 continue
-            rowspan = node.row_end - node.row_start + 1
+            row_start, row_end = spans[index]
+            rowspan = row_end - row_start + 1
             coverage[col] = rowspan - 1
-            label = horse_label(node.horse)
-            if node.horse.url:
-                label = f"<a href=\"{node.horse.url}\">{label}</a>"
-            row_cells.append(
-                f"<td class=\"{horse_class(node.horse)}\" rowspan=\"{rowspan}\">{label}</td>"
-            )
-        rows_html.append("<tr>" + "".join(row_cells) + "</tr>")
-
-    return "\n".join(rows_html)
-
-
-def build_html(root: PedigreeNode, generations: int) -> str:
-    table_rows = render_pedigree(root, generations)
-    return f"""<!DOCTYPE html>
+            horse = nodes[index].horse
+            html = cell_html.get((horse.key, rowspan))
+            if html is None:
+                label = labels.get(horse.key)
+                if label is None:
+                    label = horse_label(horse)
+                    if horse.url:
+                        label = f"<a href=\"{horse.url.translate(HTML_ESCAPE)}\">{label}</a>"
+                    labels[horse.key] = label
+                html = CELL_TEMPLATE.format(cls=horse_class(horse), rowspan=rowspan, label=label)
+                cell_html[(horse.key, rowspan)] = html
+            write(html)
+        write("</tr>")
+
+
+HTML_HEAD = """<!DOCTYPE html>
 <html lang=\"ja\">
 <head>
   <meta charset=\"utf-8\">
@@ -186,7 +237,7 @@ def build_html(root: PedigreeNode, generations: int) -> str:
   <style>
     body {{ font-family: "Hiragino Kaku Gothic ProN", "Meiryo", sans-serif; background: #f5f6f8; }}
     .pedigree {{ border-collapse: separate; border-spacing: 2px; width: 100%; max-width: 1100px; margin: 12px auto 24px; }}
-    .pedigree td {{ background: #fff; border: 1px solid #d7d7d7; padding: 8px; font-size: 13px; line-height: 1.3; vertical-align: middle; width: {100 / generations:.2f}%; }}
+    .pedigree td {{ background: #fff; border: 1px solid #d7d7d7; padding: 8px; font-size: 13px; line-height: 1.3; vertical-align: middle; width: {cell_width:.2f}%; }}
     .pedigree .b_ml {{ background: #eef4ff; }}
     .pedigree .b_fml {{ background: #fff1f4; }}
     .pedigree .b_unknown {{ background: #f2f2f2; color: #777; }}
@@ -200,13 +251,29 @@ def build_html(root: PedigreeNode, generations: int) -> str:
 <body>
   <div class="title">{generations}代血統表</div>
   <table class=\"pedigree\">
-    {table_rows}
+    """
+
+HTML_TAIL = """
   </table>
 </body>
 </html>
 """
 
 
+def write_html(
+    nodes: List[PedigreeNode], spans: List[Tuple[int, int]], generations: int, out: TextIO
+) -> None:
+    out.write(HTML_HEAD.format(cell_width=100 / generations, generations=generations))
+    render_pedigree(nodes, spans, generations, out)
+    out.write(HTML_TAIL)
+
+
+def build_html(nodes: List[PedigreeNode], spans: List[Tuple[int, int]], generations: int) -> str:
+    buffer = io.StringIO()
+    write_html(nodes, spans, generations, buffer)
+    return buffer.getvalue()
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="CSVから血統表HTMLを生成します")
     parser.add_argument("csv", type=Path, help="CSVファイルのパス")
@@ -214,12 +281,15 @@ def main() -> None:
     parser.add_argument("--generations", type=int, default=5, help="世代数(既定: 5)")
     parser.add_argument("--output", type=Path, default=Path("pedigree.html"), help="出力HTML")
     args = parser.parse_args()
+    if args.generations < 1:
+        parser.error("世代数は1以上を指定してください")
 
     horses = load_horses(args.csv)
-    root = build_tree(horses, args.root, args.generations)
-    assign_rows(root, 0, args.generations)
-    html = build_html(root, args.generations)
-    args.output.write_text(html, encoding="utf-8")
+    nodes = build_tree(horses, args.root, args.generations)
+    spans = assign_rows(nodes)
+    # Stream straight into the file rather than holding the whole page in memory.
+    with args.output.open("w", encoding="utf-8") as handle:
+        write_html(nodes, spans, args.generations, handle)
     print(f"Generated {args.output}")
 
 
@@ -1,6 +1,24 @@
 ﻿import argparse
 import io
 import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Source image, loaded once in each worker process by _init_worker.
+_worker_base = None
+
+
+def _init_worker(src):
+    global _worker_base
+    from PIL import Image
+
+    _worker_base = Image.open(src).convert("RGBA")
+
+
+def _rotate_frame(angle):
+    from PIL import Image
+
+    rotated = _worker_base.rotate(angle, resample=Image.BICUBIC, expand=False)
+    return rotated.tobytes()
 
 
 def main():
@@ -28,24 +46,22 @@ def main():
     duration = int(1000 / args.fps)
     max_bytes = int(args.max_mb * 1024 * 1024)
 
-    def build_frames(step):
-        seq = []
-        for i in range(0, frames, step):
-            angle = -360.0 * i / frames
-            rotated = base.rotate(angle, resample=Image.BICUBIC, expand=False)
-            seq.append(rotated)
-        return seq
+    def build_frames(pool):
+        # Frames are independent, so rotate them in worker processes that
+        # each load the source image once; only raw pixels come back.
+        angles = [-360.0 * i / frames for i in range(frames)]
+        return [
+            Image.frombytes(base.mode, base.size, pixels)
+            for pixels in pool.map(_rotate_frame, angles)
+        ]
 
     def save_preview(seq):
-        quantized = [
-            im.convert("P", palette=Image.Palette.ADAPTIVE, colors=128) for im in seq
-        ]
         buf = io.BytesIO()
-        quantized[0].save(
+        seq[0].save(
             buf,
             format="GIF",
             save_all=True,
-            append_images=quantized[1:],
+            append_images=seq[1:],
             duration=duration,
             loop=0,
             disposal=2,
@@ -53,14 +69,40 @@ def main():
         )
         return buf.getvalue()
 
-    step = 1
-    data = None
-    while True:
-        seq = build_frames(step)
+    with ProcessPoolExecutor(initializer=_init_worker, initargs=(src,)) as pool:
+        rotated = build_frames(pool)
+
+    # Each frame gets its own adaptive palette, as before; a palette shared
+    # across frames made the GIF larger, so fewer frames fit under max_bytes.
+    # Frames are quantized once and reused for every step tried below.
+    all_frames = [
+        im.convert("P", palette=Image.Palette.ADAPTIVE, colors=128)
+        for im in rotated
+    ]
+    del rotated
+
+    def encode(step):
+        seq = all_frames[::step]
         data = save_preview(seq)
-        if len(data) <= max_bytes or len(seq) <= 2:
-            break
-        step += 1
+        return data, len(data) <= max_bytes or len(seq) <= 2
+
+    # Keep every step-th frame, with the smallest step that fits max_bytes.
+    # The size shrinks as the step grows, so double the step until it fits
+    # and then bisect between the last miss and the first fit.
+    data, fits = encode(1)
+    if not fits:
+        miss, step = 1, 2
+        data, fits = encode(step)
+        while not fits:
+            miss, step = step, step * 2
+            data, fits = encode(step)
+        while step - miss > 1:
+            mid = (miss + step) // 2
+            mid_data, mid_fits = encode(mid)
+            if mid_fits:
+                step, data = mid, mid_data
+            else:
+                miss = mid
 
     with open(out_path, "wb") as f:
         f.write(data)
@@ -2,53 +2,106 @@
 import csv
 import os
 import sys
+from collections import namedtuple
+from operator import itemgetter
+
+ROW_COLUMNS = ("PrimaryKey", "Sire", "Dam", "Sex", "Year", "Horse Name")
+REQUIRED_COLUMNS = ("PrimaryKey", "Sire", "Dam")
+
+# One CSV row normalized at load time; PrimaryKey is the by_pk key. Sire and
+# Dam are None when blank, Sex is upper-cased and a blank name falls back to
+# the PrimaryKey.
+HorseRow = namedtuple("HorseRow", ["sire", "dam", "sex", "year", "name"])
 
 
 def load_rows(csv_path):
     with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
-        reader = csv.DictReader(f)
+        reader = csv.reader(f)
+        header = next(reader, [])
         rows = list(reader)
+    missing = [name for name in REQUIRED_COLUMNS if name not in header]
+    if missing:
+        raise SystemExit(f"CSV is missing columns: {', '.join(missing)}")
+    positions = {name: index for index, name in enumerate(header)}
+    pad = any(name not in positions for name in ROW_COLUMNS)
+    pick = itemgetter(*(positions.get(name, -1) for name in ROW_COLUMNS))
+    width = len(header)
     by_pk = {}
     for row in rows:
-        pk = (row.get("PrimaryKey") or "").strip()
+        if len(row) < width:
+            row.extend([""] * (width - len(row)))
+        if pad:
+            row.append("")
+        pk, sire, dam, sex, year, name = map(str.strip, pick(row))
         if not pk:
             continue
-        by_pk[pk] = row
+        by_pk[pk] = HorseRow(sire or None, dam or None, sex.upper(), year, name or pk)
     return by_pk
 
 
-def compute_max_depth(pk, by_pk):
+def build_depth_calculator(by_pk):
+    """Return depth_for(pk); only depths whose walk met no cycle are shared."""
     memo = {}
-    visiting = set()
-
-    def depth_for(node_pk):
-        if node_pk in memo:
-            return memo[node_pk]
-        if node_pk in visiting:
-            return 0
-        visiting.add(node_pk)
-        data = by_pk.get(node_pk)
-        if data is None:
-            memo[node_pk] = 0
-            visiting.remove(node_pk)
-            return 0
-        sire = (data.get("Sire") or "").strip()
-        dam = (data.get("Dam") or "").strip()
-        depths = [0]
-        if sire:
-            depths.append(1 + depth_for(sire))
-        if dam:
-            depths.append(1 + depth_for(dam))
-        max_depth = max(depths)
-        memo[node_pk] = max_depth
-        visiting.remove(node_pk)
-        return max_depth
 
+    def depth_for(pk):
+        if pk in memo:
+            return memo[pk]
+        # Frames are [pk, parents, next, best, cut]; cut depths stay in local.
+        local = {}
+        visiting = set()
+        stack = []
+
+        def enter(node_pk):
+            if node_pk in memo:
+                return memo[node_pk], False
+            if node_pk in local:
+                return local[node_pk], True
+            if node_pk in visiting:
+                return 0, True
+            data = by_pk.get(node_pk)
+            if data is None:
+                memo[node_pk] = 0
+                return 0, False
+            visiting.add(node_pk)
+            parents = [p for p in (data.sire, data.dam) if p]
+            stack.append([node_pk, parents, 0, 0, False])
+            return None
+
+        result = enter(pk)
+        while stack:
+            frame = stack[-1]
+            node_pk, parents, index, best, cut = frame
+            if index < len(parents):
+                frame[2] = index + 1
+                known = enter(parents[index])
+                if known is not None:
+                    frame[3] = max(best, 1 + known[0])
+                    frame[4] = cut or known[1]
+                continue
+            stack.pop()
+            visiting.remove(node_pk)
+            if cut:
+                local[node_pk] = best
+            else:
+                memo[node_pk] = best
+            if stack:
+                stack[-1][3] = max(stack[-1][3], 1 + best)
+                stack[-1][4] = stack[-1][4] or cut
+            else:
+                result = best, cut
+        return result[0]
+
+    return depth_for
+
+
+def compute_max_depth(pk, by_pk, depth_for=None):
+    if depth_for is None:
+        depth_for = build_depth_calculator(by_pk)
     return depth_for(pk)
 
 
-def clamp_depth(pk, by_pk, requested_depth):
-    max_depth = compute_max_depth(pk, by_pk)
+def clamp_depth(pk, by_pk, requested_depth, depth_for=None):
+    max_depth = compute_max_depth(pk, by_pk, depth_for)
     if requested_depth is None:
         return max_depth
     return max(0, min(max_depth, requested_depth))
@@ -59,14 +112,9 @@ def display_name(pk, data, note=""):
         base = pk
         suffix = note or "not_found"
         return f"{base} ({suffix})"
-    name = (data.get("Horse Name") or "").strip()
-    year = (data.get("Year") or "").strip()
-    if not name:
-        base = pk
-    else:
-        base = name
-    if year:
-        base = f"{base} {year}"
+    base = data.name
+    if data.year:
+        base = f"{base} {data.year}"
     if base == pk:
         return base
     return f"{base} ({pk})"
@@ -76,83 +124,118 @@ def format_horse_name_year(pk, by_pk):
     data = by_pk.get(pk)
     if data is None:
         return pk
-    name = (data.get("Horse Name") or "").strip() or pk
-    year = (data.get("Year") or "").strip()
-    return f"{name} {year}".strip()
+    return f"{data.name} {data.year}".strip()
+
+
+def index_ancestors(pk, by_pk, max_depth):
+    """Give pk and its ancestors within max_depth generations dense int ids.
+
+    Returns (keys, sire_ids, dam_ids): keys[i] is the PrimaryKey with id i
+    (pk itself is id 0) and sire_ids[i] / dam_ids[i] are its parents' ids,
+    or -1 when the parent is unknown or lies beyond max_depth. Parents
+    without a row of their own still get an id.
+    """
+    keys = [pk]
+    ids = {pk: 0}
+    first_gen = [0]
+    sire_ids = []
+    dam_ids = []
+
+    def parent_id(parent_pk, gen):
+        if not parent_pk:
+            return -1
+        node_id = ids.get(parent_pk)
+        if node_id is None:
+            node_id = ids[parent_pk] = len(keys)
+            keys.append(parent_pk)
+            first_gen.append(gen)
+        return node_id
+
+    # Ids are handed out breadth-first, so first_gen is the closest
+    # generation at which each ancestor appears.
+    node_id = 0
+    while node_id < len(keys):
+        data = by_pk.get(keys[node_id])
+        gen = first_gen[node_id]
+        if data is None or gen >= max_depth:
+            sire_ids.append(-1)
+            dam_ids.append(-1)
+        else:
+            sire_ids.append(parent_id(data.sire, gen + 1))
+            dam_ids.append(parent_id(data.dam, gen + 1))
+        node_id += 1
+    return keys, sire_ids, dam_ids
 
 
 def collect_inbreeding(pk, by_pk, max_depth):
-    occurrences = {}
-
-    def walk(node_pk, gen, path, visiting):
-        if gen > max_depth:
-            return
-        if node_pk in visiting:
-            return
-        visiting.add(node_pk)
-        new_path = path + [node_pk]
-        occurrences.setdefault(node_pk, []).append({"gen": gen, "path": new_path})
-        data = by_pk.get(node_pk)
-        if data is None:
-            visiting.remove(node_pk)
-            return
-        sire = (data.get("Sire") or "").strip()
-        dam = (data.get("Dam") or "").strip()
-        if gen < max_depth:
-            if sire:
-                walk(sire, gen + 1, new_path, visiting)
-            if dam:
-                walk(dam, gen + 1, new_path, visiting)
-        visiting.remove(node_pk)
+    keys, sire_ids, dam_ids = index_ancestors(pk, by_pk, max_depth)
 
-    data = by_pk.get(pk)
-    if data:
-        sire = (data.get("Sire") or "").strip()
-        dam = (data.get("Dam") or "").strip()
-        if sire:
-            walk(sire, 1, [], set())
-        if dam:
-            walk(dam, 1, [], set())
+    occurrences = {}
+    # `path` is the current node's ancestry, unwound to the parent on each pop.
+    path = []
+    on_path = bytearray(len(keys))
+    stack = []
+    if dam_ids[0] >= 0:
+        stack.append((dam_ids[0], 1))
+    if sire_ids[0] >= 0:
+        stack.append((sire_ids[0], 1))
+    while stack:
+        node_id, gen = stack.pop()
+        while len(path) >= gen:
+            on_path[path.pop()] = 0
+        if on_path[node_id]:
+            continue
+        path.append(node_id)
+        on_path[node_id] = 1
+        occurrences.setdefault(node_id, []).append((gen, tuple(path)))
+        if gen >= max_depth:
+            continue
+        if dam_ids[node_id] >= 0:
+            stack.append((dam_ids[node_id], gen + 1))
+        if sire_ids[node_id] >= 0:
+            stack.append((sire_ids[node_id], gen + 1))
+
+    inbred_ids = {
+        node_id: occs for node_id, occs in occurrences.items() if len(occs) >= 2
+    }
+
+    # An ancestor is subsumed when another inbred ancestor sits above it on
+    # every one of its paths. Each path ends at the ancestor itself and no
+    # node repeats on a path, so "above it" is plain membership: give each
+    # inbred ancestor one bit, OR the bits along every path, and AND those
+    # masks (without the ancestor's own bit) across its paths.
+    bits = [0] * len(keys)
+    for index, node_id in enumerate(inbred_ids):
+        bits[node_id] = 1 << index
+    subsumed = set()
+    for ancestor, occs in inbred_ids.items():
+        common = ~bits[ancestor]
+        for _, path in occs:
+            mask = 0
+            for node_id in path:
+                mask |= bits[node_id]
+            common &= mask
+            if not common:
+                break
+        if common:
+            subsumed.add(keys[ancestor])
 
     inbred = {}
-    for ancestor, occs in occurrences.items():
-        if len(occs) < 2:
-            continue
-        gens = [occ["gen"] for occ in occs]
+    for ancestor, occs in inbred_ids.items():
+        gens = [gen for gen, _ in occs]
         percentage = sum((0.5**g) for g in gens) * 100.0
         gens_sorted = sorted(gens, reverse=True)
-        paths = [occ["path"] for occ in occs]
-        inbred[ancestor] = {"gens": gens_sorted, "percentage": percentage, "paths": paths}
-
-    subsumed = set()
-    candidates = list(inbred.keys())
-    for ancestor in candidates:
-        for other in candidates:
-            if ancestor == other:
-                continue
-            all_contained = True
-            for path in inbred[ancestor]["paths"]:
-                if other not in path:
-                    all_contained = False
-                    break
-                if path.index(other) > path.index(ancestor):
-                    all_contained = False
-                    break
-            if all_contained:
-                subsumed.add(ancestor)
-                break
+        inbred[keys[ancestor]] = {"gens": gens_sorted, "percentage": percentage}
 
     return inbred, subsumed
 
 
 def write_excel(pk, by_pk, out_path, max_depth):
     try:
-        from openpyxl import Workbook
-        from openpyxl.styles import Alignment, Border, PatternFill, Side
-        from openpyxl.utils import get_column_letter
+        import xlsxwriter
     except ImportError as exc:
         raise SystemExit(
-            "openpyxl is required. Install with: pip install -r requirements.txt"
+            "xlsxwriter is required. Install with: pip install -r requirements.txt"
         ) from exc
 
     total_rows = 2**max_depth if max_depth > 0 else 1
@@ -162,32 +245,39 @@ def write_excel(pk, by_pk, out_path, max_depth):
             f"Too many rows for Excel ({total_rows} > {excel_row_limit})."
         )
 
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Pedigree"
+    # Horse names are plain text even when they look like formulas or URLs.
+    wb = xlsxwriter.Workbook(
+        out_path, {"strings_to_formulas": False, "strings_to_urls": False}
+    )
+    ws = wb.add_worksheet("Pedigree")
+
+    # Every cell format is created once here and shared by reference.
+    header_format = wb.add_format({"align": "left", "valign": "vcenter"})
+    fills = {"M": "#DDEBF7", "F": "#FCE4EC"}
+    cell_formats = {}
+    for sex in ("M", "F", ""):
+        for inbred_cell in (False, True):
+            style = {"align": "center", "valign": "vcenter", "text_wrap": True}
+            if sex:
+                style.update(pattern=1, bg_color=fills[sex])
+            if inbred_cell:
+                style.update(border=1, border_color="#FF0000")
+            cell_formats[(sex, inbred_cell)] = wb.add_format(style)
+    if max_depth > 0:
+        ws.set_column(0, max_depth - 1, 26)
 
-    align = Alignment(horizontal="center", vertical="center", wrap_text=True)
-    header_align = Alignment(horizontal="left", vertical="center")
-    sire_fill = PatternFill(fill_type="solid", fgColor="FFDDEBF7")
-    dam_fill = PatternFill(fill_type="solid", fgColor="FFFCE4EC")
-    red_side = Side(style="thin", color="FFFF0000")
-    red_border = Border(left=red_side, right=red_side, top=red_side, bottom=red_side)
-    for col_idx in range(1, max_depth + 1):
-        col_letter = get_column_letter(col_idx)
-        ws.column_dimensions[col_letter].width = 26
+    def write_range(first_row, first_col, last_row, last_col, text, cell_format):
+        if first_row == last_row and first_col == last_col:
+            ws.write_string(first_row, first_col, text, cell_format)
+        else:
+            ws.merge_range(first_row, first_col, last_row, last_col, text, cell_format)
 
     inbred, subsumed = collect_inbreeding(pk, by_pk, max_depth)
     inbred_pks = set(inbred.keys()) - subsumed
 
+    last_col = max_depth - 1 if max_depth > 0 else 0
     title = format_horse_name_year(pk, by_pk)
-    ws.merge_cells(
-        start_row=1,
-        end_row=1,
-        start_column=1,
-        end_column=max_depth if max_depth > 0 else 1,
-    )
-    title_cell = ws.cell(row=1, column=1, value=title)
-    title_cell.alignment = header_align
+    write_range(0, 0, 0, last_col, title, header_format)
 
     if inbred_pks:
         summary_parts = []
@@ -195,7 +285,7 @@ def write_excel(pk, by_pk, out_path, max_depth):
             inbred_pks, key=lambda pk: inbred[pk]["percentage"], reverse=True
         ):
             data = by_pk.get(ancestor_pk)
-            name = (data.get("Horse Name") or "").strip() if data else ancestor_pk
+            name = data.name if data else ancestor_pk
             gens_text = " x ".join(str(g) for g in inbred[ancestor_pk]["gens"])
             summary_parts.append(
                 f"{name} {inbred[ancestor_pk]['percentage']:.2f}% {gens_text}"
@@ -204,70 +294,53 @@ def write_excel(pk, by_pk, out_path, max_depth):
     else:
         summary = "No inbreeding detected within selected generations."
 
-    ws.merge_cells(
-        start_row=2,
-        end_row=2,
-        start_column=1,
-        end_column=max_depth if max_depth > 0 else 1,
-    )
-    header_cell = ws.cell(row=2, column=1, value=summary)
-    header_cell.alignment = header_align
-
-    visiting = set()
+    write_range(1, 0, 1, last_col, summary, header_format)
 
-    def place_node(node_pk, gen, row_start, row_end):
+    # Depth-first over (pk, gen, row_start, row_end); `path` holds the
+    # ancestors of the current cell, one per column.
+    path = []
+    stack = []
+    if max_depth > 0:
+        data = by_pk.get(pk)
+        sire = data.sire if data else None
+        dam = data.dam if data else None
+        mid = (total_rows - 1) // 2
+        if dam:
+            stack.append((dam, 0, mid + 1, total_rows - 1))
+        if sire:
+            stack.append((sire, 0, 0, mid))
+    while stack:
+        node_pk, gen, row_start, row_end = stack.pop()
+        del path[gen:]
         data = by_pk.get(node_pk)
-        if node_pk in visiting:
-            text = display_name(node_pk, data, note="cycle")
+        cycle = node_pk in path
+        if cycle:
+            text = display_name(node_pk, None, note="cycle")
         else:
             text = display_name(node_pk, data)
 
-        col = gen + 1
-        cell = ws.cell(row=row_start + 3, column=col, value=text)
-        cell.alignment = align
-        sex = (data.get("Sex") or "").strip().upper() if data else ""
-        if sex == "M":
-            cell.fill = sire_fill
-        elif sex == "F":
-            cell.fill = dam_fill
-        if node_pk in inbred_pks:
-            cell.border = red_border
-        if row_end > row_start:
-            ws.merge_cells(
-                start_row=row_start + 3,
-                end_row=row_end + 3,
-                start_column=col,
-                end_column=col,
-            )
+        sex = data.sex if data else ""
+        if sex not in fills:
+            sex = ""
+        cell_format = cell_formats[(sex, node_pk in inbred_pks)]
+        write_range(row_start + 2, gen, row_end + 2, gen, text, cell_format)
 
-        if data is None or gen >= max_depth - 1:
-            return
+        if cycle or data is None or gen >= max_depth - 1:
+            continue
 
-        sire = (data.get("Sire") or "").strip()
-        dam = (data.get("Dam") or "").strip()
+        sire = data.sire
+        dam = data.dam
         if not sire and not dam:
-            return
+            continue
 
+        path.append(node_pk)
         mid = (row_start + row_end) // 2
-        visiting.add(node_pk)
-        if sire:
-            place_node(sire, gen + 1, row_start, mid)
         if dam:
-            place_node(dam, gen + 1, mid + 1, row_end)
-        visiting.remove(node_pk)
+            stack.append((dam, gen + 1, mid + 1, row_end))
+        if sire:
+            stack.append((sire, gen + 1, row_start, mid))
 
-    if max_depth > 0:
-        data = by_pk.get(pk)
-        sire = (data.get("Sire") or "").strip() if data else ""
-        dam = (data.get("Dam") or "").strip() if data else ""
-        if sire or dam:
-            mid = (total_rows - 1) // 2
-            if sire:
-                place_node(sire, 0, 0, mid)
-            if dam:
-                place_node(dam, 0, mid + 1, total_rows - 1)
-
-    wb.save(out_path)
+    wb.close()
 
 
 def parse_args():
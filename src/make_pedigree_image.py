@@ -2,71 +2,249 @@
 import csv
 import math
 import os
+import pickle
 import re
+import tempfile
 import textwrap
+from collections import namedtuple
+from dataclasses import dataclass, field
+from operator import itemgetter
+
+ROW_COLUMNS = ("PrimaryKey", "Sire", "Dam", "Sex", "Year", "Horse Name")
+REQUIRED_COLUMNS = ("PrimaryKey", "Sire", "Dam")
+
+# One CSV row with its fields stripped but otherwise as written; see
+# load_rows. Unlike make_pedigree.HorseRow, a blank Sire or Dam stays ""
+# (build_index turns it into -1), Sex keeps its case (build_index upper-cases
+# it for SEX_CODES) and a blank name stays "" instead of falling back to the
+# PrimaryKey; labels apply that fallback themselves where the chart wants it.
+ChartRow = namedtuple("ChartRow", ["sire", "dam", "sex", "year", "name"])
+
+# Colts, geldings and horses draw with the sire fill, mares and fillies
+# with the dam fill; anything else is code 0.
+SEX_CODES = {"H": 1, "G": 1, "C": 1, "M": 2, "F": 2}
+
+# A trailing "(JPN)"-style country tag on a horse name.
+COUNTRY_RE = re.compile(r"\s*\([^)]*\)\s*$")
+
+# Bump when the pickled layout written by load_index changes.
+INDEX_CACHE_VERSION = 2
+
+
+@dataclass
+class PedigreeIndex:
+    """The pedigree as parallel lists indexed by a dense int id.
+
+    depth_memo[i] is the cycle-free depth of id i, or -1 when not known.
+    """
+
+    keys: list
+    ids: dict
+    rows: list
+    sire_ids: list
+    dam_ids: list
+    sex_codes: bytearray
+    depth_memo: list = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.depth_memo = [-1] * len(self.keys)
+
+    def row(self, pk):
+        """Return pk's ChartRow, or None when the CSV has no row for it."""
+        node_id = self.ids.get(pk)
+        return None if node_id is None else self.rows[node_id]
 
 
 def load_rows(csv_path):
     with open(csv_path, "r", encoding="utf-8-sig", newline="") as f:
-        reader = csv.DictReader(f)
+        reader = csv.reader(f)
+        header = next(reader, [])
         rows = list(reader)
-    by_pk = {}
+    missing = [name for name in REQUIRED_COLUMNS if name not in header]
+    if missing:
+        raise SystemExit(f"CSV is missing columns: {', '.join(missing)}")
+    positions = {name: index for index, name in enumerate(header)}
+    pad = any(name not in positions for name in ROW_COLUMNS)
+    pick = itemgetter(*(positions.get(name, -1) for name in ROW_COLUMNS))
+    width = len(header)
+    # Each PrimaryKey gets the next int id the first time it is seen; a
+    # repeated PrimaryKey keeps its id and its last row wins.
+    ids = {}
+    horse_rows = []
     for row in rows:
-        pk = (row.get("PrimaryKey") or "").strip()
+        if len(row) < width:
+            row.extend([""] * (width - len(row)))
+        if pad:
+            row.append("")
+        pk, *values = map(str.strip, pick(row))
         if not pk:
             continue
-        by_pk[pk] = row
-    return by_pk
-
-
-def compute_max_depth(pk, by_pk):
-    memo = {}
-    visiting = set()
-
-    def depth_for(node_pk):
-        if node_pk in memo:
-            return memo[node_pk]
-        if node_pk in visiting:
-            return 0
-        visiting.add(node_pk)
-        data = by_pk.get(node_pk)
-        if data is None:
-            memo[node_pk] = 0
-            visiting.remove(node_pk)
-            return 0
-        sire = (data.get("Sire") or "").strip()
-        dam = (data.get("Dam") or "").strip()
-        depths = [0]
-        if sire:
-            depths.append(1 + depth_for(sire))
-        if dam:
-            depths.append(1 + depth_for(dam))
-        max_depth = max(depths)
-        memo[node_pk] = max_depth
-        visiting.remove(node_pk)
-        return max_depth
-
-    return depth_for(pk)
+        node_id = ids.get(pk)
+        if node_id is None:
+            ids[pk] = len(horse_rows)
+            horse_rows.append(ChartRow._make(values))
+        else:
+            horse_rows[node_id] = ChartRow._make(values)
+    return ids, horse_rows
+
+
+def build_index(ids, rows):
+    """Lay the pedigree out by the int ids load_rows handed out.
+
+    A parent named in the CSV without a row of its own is appended after
+    the rows, so traversals still reach it, with no row and unknown
+    parents. keys[i] is the PrimaryKey with id i, ids maps it back (and is
+    extended in place), rows[i] is its ChartRow or None, sire_ids[i] /
+    dam_ids[i] are the parents' ids (-1 when blank) and sex_codes[i] is
+    the SEX_CODES value of the Sex column.
+    """
+    keys = list(ids)
+    sire_ids = []
+    dam_ids = []
+    sex_codes = bytearray(len(keys))
+
+    def parent_id(parent_pk):
+        if not parent_pk:
+            return -1
+        node_id = ids.get(parent_pk)
+        if node_id is None:
+            node_id = ids[parent_pk] = len(keys)
+            keys.append(parent_pk)
+        return node_id
+
+    for node_id, data in enumerate(rows):
+        sire_ids.append(parent_id(data.sire))
+        dam_ids.append(parent_id(data.dam))
+        sex_codes[node_id] = SEX_CODES.get(data.sex.upper(), 0)
+    extra = len(keys) - len(rows)
+    sire_ids.extend([-1] * extra)
+    dam_ids.extend([-1] * extra)
+    sex_codes.extend(bytes(extra))
+    rows = rows + [None] * extra
+    return PedigreeIndex(keys, ids, rows, sire_ids, dam_ids, sex_codes)
+
+
+def load_index(csv_path):
+    """Return build_index(*load_rows(csv_path)), cached next to the CSV.
+
+    The index is pickled to csv_path + ".pkl" as plain lists, tagged with
+    INDEX_CACHE_VERSION and the CSV's (st_mtime_ns, st_size); it is reused
+    only when both match. Anything else, including an unreadable cache,
+    means parsing the CSV again and rewriting the cache in place.
+    """
+    cache_path = csv_path + ".pkl"
+    stat = os.stat(csv_path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    try:
+        with open(cache_path, "rb") as f:
+            cached = pickle.load(f)
+        if (
+            isinstance(cached, tuple)
+            and len(cached) == 7
+            and cached[0] == INDEX_CACHE_VERSION
+            and cached[1] == stamp
+        ):
+            _, _, keys, rows, sire_ids, dam_ids, sex_codes = cached
+            ids = {pk: node_id for node_id, pk in enumerate(keys)}
+            rows = [None if row is None else ChartRow._make(row) for row in rows]
+            return PedigreeIndex(keys, ids, rows, sire_ids, dam_ids, sex_codes)
+    except Exception:
+        pass
+
+    index = build_index(*load_rows(csv_path))
+    cached = (
+        INDEX_CACHE_VERSION,
+        stamp,
+        index.keys,
+        [None if row is None else tuple(row) for row in index.rows],
+        index.sire_ids,
+        index.dam_ids,
+        index.sex_codes,
+    )
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(cache_path) or ".", suffix=".tmp"
+        )
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        if tmp_path is not None and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return index
+
+
+def compute_max_depth(pk, index):
+    root_id = index.ids.get(pk)
+    if root_id is None:
+        return 0
+    sire_ids = index.sire_ids
+    dam_ids = index.dam_ids
+    memo = index.depth_memo
+    if memo[root_id] >= 0:
+        return memo[root_id]
+    # Frames are [node_id, parents seen, best, cut]; a parent on the stack
+    # counts as 0, and cut depths stay in local rather than the shared memo.
+    local = {}
+    visiting = bytearray(len(index.keys))
+    visiting[root_id] = 1
+    stack = [[root_id, 0, 0, False]]
+    while stack:
+        frame = stack[-1]
+        node_id, step, best, cut = frame
+        if step < 2:
+            frame[1] = step + 1
+            parent = sire_ids[node_id] if step == 0 else dam_ids[node_id]
+            if parent < 0:
+                continue
+            if memo[parent] >= 0:
+                depth = memo[parent]
+            elif parent in local:
+                depth = local[parent]
+                frame[3] = True
+            elif visiting[parent]:
+                depth = 0
+                frame[3] = True
+            else:
+                visiting[parent] = 1
+                stack.append([parent, 0, 0, False])
+                continue
+            if depth + 1 > best:
+                frame[2] = depth + 1
+            continue
+        stack.pop()
+        visiting[node_id] = 0
+        if cut:
+            local[node_id] = best
+        else:
+            memo[node_id] = best
+        if stack:
+            if best + 1 > stack[-1][2]:
+                stack[-1][2] = best + 1
+            if cut:
+                stack[-1][3] = True
+    return memo[root_id] if memo[root_id] >= 0 else local[root_id]
 
 
-def clamp_depth(pk, by_pk, requested_depth):
-    max_depth = compute_max_depth(pk, by_pk)
+def clamp_depth(pk, index, requested_depth):
+    max_depth = compute_max_depth(pk, index)
     if requested_depth is None:
         return max_depth
     return max(0, min(max_depth, requested_depth))
 
 
 def strip_country(name):
-    return re.sub(r"\s*\([^)]*\)\s*$", "", name).strip()
+    return COUNTRY_RE.sub("", name).strip()
 
 
 def format_horse_label(
-    pk, by_pk, include_year, strip_country_tag, single_line=False
+    pk, index, include_year, strip_country_tag, single_line=False
 ):
-    data = by_pk.get(pk)
+    data = index.row(pk)
     if data is None:
         return pk
-    raw_name = (data.get("Horse Name") or "").strip() or pk
+    raw_name = data.name or pk
     if strip_country_tag:
         name = strip_country(raw_name)
         country = ""
@@ -78,7 +256,7 @@ def format_horse_label(
         else:
             name = raw_name
             country = ""
-    year = (data.get("Year") or "").strip()
+    year = data.year
     if include_year and year:
         second = f"{country} {year}".strip()
         if single_line:
@@ -89,161 +267,178 @@ def format_horse_label(
     return name
 
 
-def collect_inbreeding(pk, by_pk, max_depth):
-    occurrences = {}
+def collect_inbreeding(pk, index, max_depth):
+    try:
+        import numpy as np
+    except ImportError as exc:
+        raise SystemExit(
+            "numpy is required. Install with: pip install -r requirements.txt"
+        ) from exc
 
-    def walk(node_pk, gen, path, visiting, side):
-        if gen > max_depth:
-            return
-        if node_pk in visiting:
-            return
-        visiting.add(node_pk)
-        new_path = path + [node_pk]
-        occurrences.setdefault(node_pk, []).append(
-            {"gen": gen, "path": new_path, "side": side}
-        )
-        data = by_pk.get(node_pk)
-        if data is None:
-            visiting.remove(node_pk)
-            return
-        sire = (data.get("Sire") or "").strip()
-        dam = (data.get("Dam") or "").strip()
-        if gen < max_depth:
-            if sire:
-                walk(sire, gen + 1, new_path, visiting, side)
-            if dam:
-                walk(dam, gen + 1, new_path, visiting, side)
-        visiting.remove(node_pk)
-
-    data = by_pk.get(pk)
-    if data:
-        sire = (data.get("Sire") or "").strip()
-        dam = (data.get("Dam") or "").strip()
-        if sire:
-            walk(sire, 1, [], set(), "Sire")
-        if dam:
-            walk(dam, 1, [], set(), "Dam")
+    sire_ids = index.sire_ids
+    dam_ids = index.dam_ids
+    # Every appearance of an ancestor is one entry in these flat lists:
+    # its id, generation, whether it came through the sire (1) or the dam
+    # (0), and its path from generation 1.
+    occ_ids = []
+    occ_gens = []
+    occ_from_sire = []
+    occ_paths = []
+    # `path` is the current node's ancestry, unwound to the parent on each pop.
+    path = []
+    on_path = bytearray(len(index.keys))
+    stack = []
+    root_id = index.ids.get(pk)
+    if root_id is not None and max_depth >= 1:
+        if dam_ids[root_id] >= 0:
+            stack.append((dam_ids[root_id], 1, 0))
+        if sire_ids[root_id] >= 0:
+            stack.append((sire_ids[root_id], 1, 1))
+    while stack:
+        node_id, gen, from_sire = stack.pop()
+        while len(path) >= gen:
+            on_path[path.pop()] = 0
+        if on_path[node_id]:
+            continue
+        path.append(node_id)
+        on_path[node_id] = 1
+        occ_ids.append(node_id)
+        occ_gens.append(gen)
+        occ_from_sire.append(from_sire)
+        occ_paths.append(tuple(path))
+        if gen >= max_depth:
+            continue
+        if dam_ids[node_id] >= 0:
+            stack.append((dam_ids[node_id], gen + 1, from_sire))
+        if sire_ids[node_id] >= 0:
+            stack.append((sire_ids[node_id], gen + 1, from_sire))
+
+    # Per-ancestor totals in one pass each. An appearance at generation g
+    # contributes 0.5 ** g; bincount adds them in walk order, so the sums
+    # match adding them up ancestor by ancestor.
+    ids = np.array(occ_ids, dtype=np.intp)
+    weights = 0.5 ** np.arange(max_depth + 1)
+    counts = np.bincount(ids)
+    percentages = np.bincount(ids, weights=weights[occ_gens]) * 100.0
+    sire_counts = np.bincount(ids, weights=occ_from_sire)
+    # The appearances of each ancestor, grouped in walk order.
+    order = np.argsort(ids, kind="stable")
+    starts = np.cumsum(counts) - counts
 
     inbred = {}
     inbred_types = {}
-    for ancestor, occs in occurrences.items():
-        if len(occs) < 2:
-            continue
-        gens = [occ["gen"] for occ in occs]
-        percentage = sum((0.5**g) for g in gens) * 100.0
-        gens_sorted = sorted(gens, reverse=True)
-        paths = [occ["path"] for occ in occs]
-        sides = {occ["side"] for occ in occs}
-        inbred[ancestor] = {"gens": gens_sorted, "percentage": percentage, "paths": paths}
-        if sides == {"Sire"}:
+    inbred_paths = {}
+    for ancestor in np.flatnonzero(counts >= 2).tolist():
+        start = starts[ancestor]
+        picks = order[start : start + counts[ancestor]].tolist()
+        inbred[ancestor] = {
+            "gens": sorted((occ_gens[i] for i in picks), reverse=True),
+            "percentage": float(percentages[ancestor]),
+        }
+        inbred_paths[ancestor] = [occ_paths[i] for i in picks]
+        if sire_counts[ancestor] == len(picks):
             inbred_types[ancestor] = "sire"
-        elif sides == {"Dam"}:
+        elif sire_counts[ancestor] == 0:
             inbred_types[ancestor] = "dam"
         else:
             inbred_types[ancestor] = "both"
 
+    # An ancestor is subsumed when another inbred ancestor sits at or above
+    # it on every one of its paths. Each path ends at the ancestor itself
+    # and no node repeats on a path, so "at or above" is plain membership:
+    # intersect the ancestor's paths and look for another inbred ancestor.
     subsumed = set()
-    candidates = list(inbred.keys())
-    for ancestor in candidates:
-        for other in candidates:
-            if ancestor == other:
-                continue
-            all_contained = True
-            for path in inbred[ancestor]["paths"]:
-                if other not in path:
-                    all_contained = False
-                    break
-                if path.index(other) > path.index(ancestor):
-                    all_contained = False
-                    break
-            if all_contained:
-                subsumed.add(ancestor)
-                break
-
-    return inbred, subsumed, inbred_types
-
-
-def build_inbreeding_calculator(by_pk):
-    depth_cache = {}
+    for ancestor, paths in inbred_paths.items():
+        common = set(paths[0]).intersection(*paths[1:])
+        common.discard(ancestor)
+        if any(node_id in inbred for node_id in common):
+            subsumed.add(ancestor)
+
+    # Report ancestors by PrimaryKey.
+    keys = index.keys
+    return (
+        {keys[node_id]: entry for node_id, entry in inbred.items()},
+        {keys[node_id] for node_id in subsumed},
+        {keys[node_id]: kind for node_id, kind in inbred_types.items()},
+    )
+
+
+def build_inbreeding_calculator(index):
+    keys = index.keys
+    rows = index.rows
+    sire_ids = index.sire_ids
+    dam_ids = index.dam_ids
+    # Everything below works on ids; -1 is a blank parent, and rows[i] is
+    # None for a parent the CSV has no row for.
+    depth_cache = [-1] * len(keys)
     f_cache = {}
     kin_cache = {}
-    depth_stack = set()
-    f_stack = set()
+    depth_stack = bytearray(len(keys))
+    f_stack = bytearray(len(keys))
     kin_stack = set()
 
-    def is_unknown(pk):
-        return not pk
+    def has_row(node_id):
+        return node_id >= 0 and rows[node_id] is not None
 
-    def has_known_parents(pk):
-        if is_unknown(pk):
-            return False
-        data = by_pk.get(pk)
-        if data is None:
+    def has_known_parents(node_id):
+        if not has_row(node_id):
             return False
-        sire = (data.get("Sire") or "").strip()
-        dam = (data.get("Dam") or "").strip()
-        if not sire or not dam:
+        sire = sire_ids[node_id]
+        dam = dam_ids[node_id]
+        if sire < 0 or dam < 0:
             return False
-        if sire == pk or dam == pk:
+        if sire == node_id or dam == node_id:
             return False
-        if sire not in by_pk or dam not in by_pk:
+        if rows[sire] is None or rows[dam] is None:
             return False
         return True
 
-    def get_depth(pk):
-        if is_unknown(pk) or pk not in by_pk:
+    def get_depth(node_id):
+        if not has_row(node_id):
             return 0
-        if pk in depth_cache:
-            return depth_cache[pk]
-        if pk in depth_stack:
+        if depth_cache[node_id] >= 0:
+            return depth_cache[node_id]
+        if depth_stack[node_id]:
             return 0
-        depth_stack.add(pk)
-        if has_known_parents(pk):
-            data = by_pk[pk]
+        depth_stack[node_id] = 1
+        if has_known_parents(node_id):
             depth = 1 + max(
-                get_depth((data.get("Sire") or "").strip()),
-                get_depth((data.get("Dam") or "").strip()),
+                get_depth(sire_ids[node_id]),
+                get_depth(dam_ids[node_id]),
             )
         else:
             depth = 0
-        depth_stack.remove(pk)
-        depth_cache[pk] = depth
+        depth_stack[node_id] = 0
+        depth_cache[node_id] = depth
         return depth
 
-    def get_inbreeding(pk):
-        if pk in f_cache:
-            return f_cache[pk]
-        if pk in f_stack:
+    def inbreeding_for(node_id):
+        if node_id in f_cache:
+            return f_cache[node_id]
+        if f_stack[node_id]:
             return 0.0
-        f_stack.add(pk)
-        if not has_known_parents(pk):
+        f_stack[node_id] = 1
+        if not has_known_parents(node_id):
             res = 0.0
         else:
-            data = by_pk[pk]
-            res = get_kinship(
-                (data.get("Sire") or "").strip(),
-                (data.get("Dam") or "").strip(),
-            )
-        f_stack.remove(pk)
-        f_cache[pk] = res
+            res = get_kinship(sire_ids[node_id], dam_ids[node_id])
+        f_stack[node_id] = 0
+        f_cache[node_id] = res
         return res
 
     def get_kinship(a, b):
-        if is_unknown(a) or is_unknown(b):
-            return 0.0
-        if a not in by_pk or b not in by_pk:
+        if not has_row(a) or not has_row(b):
             return 0.0
         key = (a, b) if a <= b else (b, a)
         if key in kin_cache:
             return kin_cache[key]
 
-        guard = f"{key[0]}|{key[1]}"
-        if guard in kin_stack:
+        if key in kin_stack:
             return 0.0
-        kin_stack.add(guard)
+        kin_stack.add(key)
 
         if a == b:
-            res = 0.5 * (1.0 + get_inbreeding(a))
+            res = 0.5 * (1.0 + inbreeding_for(a))
         else:
             u, v = a, b
             du, dv = get_depth(u), get_depth(v)
@@ -258,7 +453,7 @@ def build_inbreeding_calculator(by_pk):
                     return True
                 if ku and not kv:
                     return False
-                return u > v
+                return keys[u] > keys[v]
 
             if need_swap():
                 u, v = v, u
@@ -268,53 +463,63 @@ def build_inbreeding_calculator(by_pk):
             if not has_known_parents(u):
                 res = 0.0
             else:
-                data_u = by_pk[u]
                 res = 0.5 * (
-                    get_kinship((data_u.get("Sire") or "").strip(), v)
-                    + get_kinship((data_u.get("Dam") or "").strip(), v)
+                    get_kinship(sire_ids[u], v)
+                    + get_kinship(dam_ids[u], v)
                 )
 
-        kin_stack.remove(guard)
+        kin_stack.remove(key)
         kin_cache[key] = res
         return res
 
+    def get_inbreeding(pk):
+        node_id = index.ids.get(pk)
+        if node_id is None:
+            return 0.0
+        return inbreeding_for(node_id)
+
     return get_inbreeding
 
 
-def build_blood_fraction_calculator(by_pk, ancestor_pk):
+def build_blood_fraction_calculator(index, ancestor_pk):
+    rows = index.rows
+    sire_ids = index.sire_ids
+    dam_ids = index.dam_ids
+    ancestor_id = index.ids.get(ancestor_pk)
     memo = {}
-    visiting = set()
+    visiting = bytearray(len(index.keys))
 
-    def blood_fraction(pk):
-        if not pk or pk not in by_pk:
+    def fraction_for(node_id):
+        if node_id < 0 or rows[node_id] is None:
             return 0.0
-        if pk == ancestor_pk:
+        if node_id == ancestor_id:
             return 1.0
-        if pk in memo:
-            return memo[pk]
-        if pk in visiting:
+        if node_id in memo:
+            return memo[node_id]
+        if visiting[node_id]:
             return 0.0
-        visiting.add(pk)
-        data = by_pk.get(pk)
-        if data is None:
-            visiting.remove(pk)
-            memo[pk] = 0.0
+        visiting[node_id] = 1
+        sire = sire_ids[node_id]
+        dam = dam_ids[node_id]
+        if sire < 0 and dam < 0:
+            visiting[node_id] = 0
+            memo[node_id] = 0.0
             return 0.0
-        sire = (data.get("Sire") or "").strip()
-        dam = (data.get("Dam") or "").strip()
-        if not sire and not dam:
-            visiting.remove(pk)
-            memo[pk] = 0.0
-            return 0.0
-        if sire == pk:
-            sire = ""
-        if dam == pk:
-            dam = ""
-        frac = 0.5 * (blood_fraction(sire) + blood_fraction(dam))
-        visiting.remove(pk)
-        memo[pk] = frac
+        if sire == node_id:
+            sire = -1
+        if dam == node_id:
+            dam = -1
+        frac = 0.5 * (fraction_for(sire) + fraction_for(dam))
+        visiting[node_id] = 0
+        memo[node_id] = frac
         return frac
 
+    def blood_fraction(pk):
+        node_id = index.ids.get(pk)
+        if node_id is None:
+            return 0.0
+        return fraction_for(node_id)
+
     return blood_fraction
 
 
@@ -369,9 +574,10 @@ def place_wedge_text(
     )
 
 
-def draw_chart(pk, by_pk, max_depth, out_path, blood_pks=None):
+def draw_chart(pk, index, max_depth, out_path, blood_pks=None, dpi=200):
     try:
         import matplotlib.pyplot as plt
+        from matplotlib.collections import PatchCollection
         from matplotlib.patches import Wedge
     except ImportError as exc:
         raise SystemExit(
@@ -381,7 +587,7 @@ def draw_chart(pk, by_pk, max_depth, out_path, blood_pks=None):
     if max_depth <= 0:
         raise SystemExit("Generations must be at least 1 for the circular chart.")
 
-    inbred, subsumed, inbred_types = collect_inbreeding(pk, by_pk, max_depth)
+    inbred, subsumed, inbred_types = collect_inbreeding(pk, index, max_depth)
     inbred_pks = set(inbred.keys()) - subsumed
 
     fig_size = max(8, 2 + max_depth * 1.3)
@@ -413,112 +619,155 @@ def draw_chart(pk, by_pk, max_depth, out_path, blood_pks=None):
             return base + extra_per_gen * (gen - 8)
         return base
 
-    def draw_wedge(node_pk, gen, angle_start, angle_end):
-        data = by_pk.get(node_pk)
-        sex = (data.get("Sex") or "").strip().upper() if data else ""
-        if sex == "H" or sex == "G" or sex == "C":
-            face = sire_fill
-        elif sex == "M" or sex == "F":
-            face = dam_fill
-        else:
-            face = unknown_fill
-
-        r_inner = ring_inner(gen)
-        r_outer = ring_outer(gen)
-        wedge = Wedge(
-            center=(0.0, 0.0),
-            r=r_outer,
-            theta1=math.degrees(angle_start),
-            theta2=math.degrees(angle_end),
-            width=r_outer - r_inner,
-            facecolor=face,
-            edgecolor=edge_default,
-            linewidth=0.5,
-        )
-        ax.add_patch(wedge)
-        if node_pk in inbred_pks:
-            inbred_type = inbred_types.get(node_pk)
-            if inbred_type == "sire":
-                wedge.set_edgecolor(edge_inbred_sire)
-            elif inbred_type == "dam":
-                wedge.set_edgecolor(edge_inbred_dam)
-            else:
-                wedge.set_edgecolor(edge_inbred_both)
-            wedge.set_linewidth(1.2)
+    # Ring radii and label sizes depend only on the generation; index 0 is
+    # the subject horse, which has no ring.
+    generations = range(1, max_depth + 1)
+    inner_radii = [0.0] + [ring_inner(gen) for gen in generations]
+    outer_radii = [0.0] + [ring_outer(gen) for gen in generations]
+    font_sizes = [0.0] + [max(0.3, 11 / (2 ** (gen - 1))) for gen in generations]
+
+    keys = index.keys
+    sire_ids = index.sire_ids
+    dam_ids = index.dam_ids
+    sex_codes = index.sex_codes
+    # Inbred ancestors recur across the chart; format each label once.
+    labels = {}
+    # Wedge fill by SEX_CODES value, and the outline of each highlighted
+    # inbred ancestor by id.
+    faces = (unknown_fill, sire_fill, dam_fill)
+    edge_by_type = {
+        "sire": edge_inbred_sire,
+        "dam": edge_inbred_dam,
+        "both": edge_inbred_both,
+    }
+    inbred_edges = {
+        index.ids[ancestor_pk]: edge_by_type[inbred_types[ancestor_pk]]
+        for ancestor_pk in inbred_pks
+    }
+
+    data = index.row(pk)
+    if data is None:
+        raise SystemExit(f"PrimaryKey not found in CSV: {pk}")
 
-        if gen >= 8:
-            label = format_horse_label(
-                node_pk,
-                by_pk,
-                include_year=False,
-                strip_country_tag=True,
-                single_line=True,
-            )
+    root_id = index.ids[pk]
+    sire = sire_ids[root_id]
+    dam = dam_ids[root_id]
+
+    sire_start, sire_end = math.radians(90), math.radians(270)
+    dam_start, dam_end = math.radians(-90), math.radians(90)
+
+    def slot_angles(start, end):
+        """Return the slot boundaries of one half of the chart by generation.
+
+        Generation gen splits [start, end] into 2 ** (gen - 1) slots, and
+        slot i spans angles[gen][i] to angles[gen][i + 1]. Each generation
+        halves the previous one's slots, so the dam of the horse in slot i
+        sits in slot 2 * i and the sire in slot 2 * i + 1.
+        """
+        angles = [None, [start, end]]
+        for _ in range(2, max_depth + 1):
+            previous = angles[-1]
+            current = []
+            for left, right in zip(previous, previous[1:]):
+                current.append(left)
+                current.append((left + right) / 2)
+            current.append(previous[-1])
+            angles.append(current)
+        return angles
+
+    # Preorder walk with an explicit stack of (id, gen, slot, angles), where
+    # angles is the slot table of the horse's half of the chart; the sire
+    # is pushed last so it is drawn first. The wedges are gathered and
+    # added as a single collection afterwards.
+    wedges = []
+    stack = []
+    if dam >= 0:
+        stack.append((dam, 1, 0, slot_angles(dam_start, dam_end)))
+    if sire >= 0:
+        stack.append((sire, 1, 0, slot_angles(sire_start, sire_end)))
+    while stack:
+        node_id, gen, slot, angles = stack.pop()
+        angle_start = angles[gen][slot]
+        angle_end = angles[gen][slot + 1]
+        face = faces[sex_codes[node_id]]
+        edge = inbred_edges.get(node_id)
+        if edge is None:
+            edge = edge_default
+            linewidth = 0.5
         else:
-            label = format_horse_label(
-                node_pk,
-                by_pk,
-                include_year=True,
-                strip_country_tag=False,
-                single_line=False,
+            linewidth = 1.2
+
+        r_inner = inner_radii[gen]
+        r_outer = outer_radii[gen]
+        wedges.append(
+            Wedge(
+                center=(0.0, 0.0),
+                r=r_outer,
+                theta1=math.degrees(angle_start),
+                theta2=math.degrees(angle_end),
+                width=r_outer - r_inner,
+                facecolor=face,
+                edgecolor=edge,
+                linewidth=linewidth,
             )
+        )
+
+        compact = gen >= 8
+        label = labels.get((node_id, compact))
+        if label is None:
+            node_pk = keys[node_id]
+            if compact:
+                label = format_horse_label(
+                    node_pk,
+                    index,
+                    include_year=False,
+                    strip_country_tag=True,
+                    single_line=True,
+                )
+            else:
+                label = format_horse_label(
+                    node_pk,
+                    index,
+                    include_year=True,
+                    strip_country_tag=False,
+                    single_line=False,
+                )
+            labels[(node_id, compact)] = label
 
-        font_size = max(0.3, 11 / (2 ** (gen - 1)))
         place_wedge_text(
-            ax, label, r_inner, r_outer, angle_start, angle_end, font_size, gen
+            ax, label, r_inner, r_outer, angle_start, angle_end, font_sizes[gen], gen
         )
 
         if gen >= max_depth:
-            return
-
-        if data is None:
-            return
-
-        sire = (data.get("Sire") or "").strip()
-        dam = (data.get("Dam") or "").strip()
-        if not sire and not dam:
-            return
-
-        mid = (angle_start + angle_end) / 2
-        # Left half (positive angles): top = dam, bottom = sire.
-        # Right half (negative to positive): top = sire, bottom = dam.
-        if angle_start > 0 and angle_end > 0:
-            sire_range = (mid, angle_end)
-            dam_range = (angle_start, mid)
-        else:
-            sire_range = (mid, angle_end)
-            dam_range = (angle_start, mid)
-        if sire:
-            draw_wedge(sire, gen + 1, sire_range[0], sire_range[1])
-        if dam:
-            draw_wedge(dam, gen + 1, dam_range[0], dam_range[1])
-
-    data = by_pk.get(pk)
-    if data is None:
-        raise SystemExit(f"PrimaryKey not found in CSV: {pk}")
+            continue
 
-    sire = (data.get("Sire") or "").strip()
-    dam = (data.get("Dam") or "").strip()
+        sire = sire_ids[node_id]
+        dam = dam_ids[node_id]
+        if sire < 0 and dam < 0:
+            continue
 
-    sire_start, sire_end = math.radians(90), math.radians(270)
-    dam_start, dam_end = math.radians(-90), math.radians(90)
+        # The sire takes the larger angles of the slot and the dam the
+        # smaller: left half top = dam, bottom = sire; right half top =
+        # sire, bottom = dam.
+        if dam >= 0:
+            stack.append((dam, gen + 1, 2 * slot, angles))
+        if sire >= 0:
+            stack.append((sire, gen + 1, 2 * slot + 1, angles))
 
-    if sire:
-        draw_wedge(sire, 1, sire_start, sire_end)
-    if dam:
-        draw_wedge(dam, 1, dam_start, dam_end)
+    ax.add_collection(
+        PatchCollection(wedges, match_original=True, joinstyle="miter")
+    )
 
-    data = by_pk.get(pk) or {}
-    raw_name = (data.get("Horse Name") or "").strip() or pk
-    year = (data.get("Year") or "").strip()
-    get_inbreeding = build_inbreeding_calculator(by_pk)
+    raw_name = data.name or pk
+    year = data.year
+    get_inbreeding = build_inbreeding_calculator(index)
     coef = get_inbreeding(pk)
     coef_text = f"F={coef * 100:.2f}%"
     label_parts = [raw_name, year, coef_text]
     for ancestor_pk in (blood_pks or []):
-        if ancestor_pk not in by_pk:
+        if index.row(ancestor_pk) is None:
             continue
-        get_blood = build_blood_fraction_calculator(by_pk, ancestor_pk)
+        get_blood = build_blood_fraction_calculator(index, ancestor_pk)
         blood_value = get_blood(pk) * 100.0
         blood_text = f"{ancestor_pk}={format_trunc_percent(blood_value, 4)}"
         label_parts.append(blood_text)
@@ -538,9 +787,9 @@ def draw_chart(pk, by_pk, max_depth, out_path, blood_pks=None):
         for ancestor_pk in sorted(
             inbred_pks, key=lambda key: inbred[key]["percentage"], reverse=True
         ):
-            data = by_pk.get(ancestor_pk)
+            data = index.row(ancestor_pk)
             if data:
-                name = strip_country((data.get("Horse Name") or "").strip())
+                name = strip_country(data.name)
             else:
                 name = ancestor_pk
             gens_text = " x ".join(
@@ -587,7 +836,15 @@ def draw_chart(pk, by_pk, max_depth, out_path, blood_pks=None):
     ax.set_xlim(-radius_limit, radius_limit)
     ax.set_ylim(-1.4 - max_extra, 1.35 + max_extra)
 
-    fig.savefig(out_path, dpi=200, bbox_inches="tight")
+    # bbox_inches="tight" makes savefig draw the whole chart once just to
+    # measure it; measuring the artists directly gives the same box.
+    fig.set_dpi(dpi)
+    bbox = fig.get_tightbbox(fig.canvas.get_renderer())
+    fig.savefig(
+        out_path,
+        dpi=dpi,
+        bbox_inches=bbox.padded(plt.rcParams["savefig.pad_inches"]),
+    )
     # circle_path = os.path.splitext(out_path)[0] + "_circle.png"
     # summary_text.set_visible(False)
     # title_text.set_visible(False)
@@ -620,6 +877,12 @@ def parse_args():
         default=None,
         help="Max generations (default: prompt, fallback to 5)",
     )
+    parser.add_argument(
+        "--dpi",
+        type=int,
+        default=200,
+        help="Output image resolution (default: 200)",
+    )
     parser.add_argument(
         "--blood",
         default="",
@@ -640,7 +903,7 @@ def main():
     if not os.path.exists(csv_path):
         raise SystemExit(f"CSV not found: {csv_path}")
 
-    by_pk = load_rows(csv_path)
+    index = load_index(csv_path)
 
     gen = args.gen
     if gen is None:
@@ -654,8 +917,10 @@ def main():
             gen = 9
     if gen < 1:
         raise SystemExit("Generations must be >= 1.")
+    if args.dpi < 1:
+        raise SystemExit("DPI must be >= 1.")
 
-    max_depth = clamp_depth(pk, by_pk, gen)
+    max_depth = clamp_depth(pk, index, gen)
 
     blood_pks = []
     blood_input = args.blood
@@ -675,7 +940,9 @@ def main():
             blood_pks.append(token)
 
     out_path = args.out or f"{pk}.png"
-    draw_chart(pk, by_pk, max_depth, out_path, blood_pks=blood_pks)
+    draw_chart(
+        pk, index, max_depth, out_path, blood_pks=blood_pks, dpi=args.dpi
+    )
     print(f"Wrote: {out_path}")
 
 